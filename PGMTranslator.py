@@ -7,18 +7,69 @@
 
 # Standard imports
 import argparse
+import atexit
+from codecs import getincrementaldecoder
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 import json
-from os import path
-from shutil import copy
+import mmap
+from os import getpid, path, remove, replace
+from random import random
+import re
+from shutil import copymode
 from sys import exit
 import tempfile
+from threading import Lock
+from time import sleep
 
 # Third-party modules imports
 from colorama import Fore, Style
-from tqdm import tqdm, contrib
+from tqdm import tqdm
 import translators as ts
 
+# orjson is optional, it is much faster than the standard json module on large files.
+# Both functions work with bytes
+try:
+  import orjson
+  json_loads = orjson.loads
+  json_dumps = orjson.dumps
+except ImportError:
+  orjson = None
+  json_loads = json.loads
+  json_dumps = lambda obj: json.dumps(obj, ensure_ascii=False, separators=(',',':')).encode('utf-8')
+
+# Size of the blocks read when scanning a file, and of the
+# first window read when parsing a small node of the file
+STREAM_CHUNK_SIZE = 1 << 20
+NODE_WINDOW_SIZE = 1 << 16
+
+# Characters ignored outside the JSON strings and pattern matching the
+# rest of a string (escape sequences included) up to the closing quote
+JSON_WHITESPACES = b' \t\n\r'
+JSON_STRING_END = re.compile(rb'[^"\\]*(?:\\.[^"\\]*)*"', re.S)
+
+# Separator used to join the strings translated with a single request,
+# and the maximum length of the text sent with a single request
+BATCH_SEPARATOR = "\n@@@\n"
+BATCH_SEPARATOR_PATTERN = re.compile(r"\s*@@@\s*")
+BATCH_MAX_LENGTH = 4000
+
+# Maximum number of times a request refused by the translation service is repeated
+MAX_RETRIES = 5
+
+# Translations already carried out, keyed on (source language, destination language, text).
+# They are saved on disk so that a new execution does not repeat the same requests
+TRANSLATION_CACHE_PATH = path.join(path.expanduser("~"), ".pgm-translator-cache.json")
+_TRANSLATION_CACHE: dict = {}
+
+# Number of translated blocks after which the progress is saved, the lock
+# prevents the blocks from being modified by other threads while they are saved
+CHECKPOINT_INTERVAL = 50
+_TRANSLATION_LOCK = Lock()
+
 ### Utils functions ###
+@lru_cache(maxsize=None)
 def iso_from_locale(locale: str):
   separator_index = -1
   if '-' in locale:
@@ -35,290 +86,493 @@ def message(t: str, text: str):
   # Print the message
   print(f"{prefix} {text}")
 
-def is_slice_in_list(slice, list):
-  '''
-  Check if a 'slice' array is contained in the array 'list'.
-  
-  Credits to: https://stackoverflow.com/a/20789669
-  '''
-  len_s = len(slice) #so we don't recompute length of s on every iteration
-  return any(slice == list[i:len_s+i] for i in range(len(list) - len_s+1))
+def load_translation_cache(cache_path=TRANSLATION_CACHE_PATH):
+  if not path.exists(cache_path): return
+
+  try:
+    with open(cache_path, "r", encoding='utf-8') as f:
+      for src, dst, value, translation in json.load(f):
+        _TRANSLATION_CACHE[(src, dst, value)] = translation
+  except (OSError, ValueError) as e:
+    message("error", f"Unable to load the translation cache: {e}")
+
+def save_translation_cache(cache_path=TRANSLATION_CACHE_PATH):
+  # Write the cache in a temporary file and then replace the old one,
+  # so that an interrupted save does not corrupt the cache
+  temp_path = f"{cache_path}.tmp"
+  with open(temp_path, "w", encoding='utf-8') as f:
+    json.dump([[*key, translation] for key, translation in list(_TRANSLATION_CACHE.items())], f)
+  replace(temp_path, cache_path)
 
 ### Json/stream related functions ###
 def find_couple_brackets_end(file, open_bracket='[', close_bracket=']', reset=True) -> int:
   '''
-  Given a JSON file already open as a text, and positioned the cursor
+  Given a JSON file already open as binary (or mapped in memory), and positioned the cursor
   in the position of the opening bracket concerned, identifies the
   corresponding closing bracket.
+
+  Brackets contained in JSON strings are ignored.
+  Returns -1 if the closing bracket is not found.
   '''
   # Save the start position in the file
   start = file.tell()
 
+  # Convert the brackets to bytes and prepare the patterns of the
+  # characters that matter outside and inside a JSON string
+  ob = open_bracket.encode()
+  cb = close_bracket.encode()
+  outside_string = re.compile(b'[' + re.escape(ob) + re.escape(cb) + b'"]')
+  inside_string = re.compile(rb'[\\"]')
+
   # We know that it ends with `close_bracket` so we move the cursor to the next position (+1)
-  file.read(1)  # With text files we cannot use f.seek(1, 1)
+  file.seek(1, 1)
   # and declare a variable (1 because an open bracket is what we skipped)
   brackets_open = 1
-  # Now we iterate the file searching for '[' or ']' with the rule
+  in_string = False
+  skip_next = False # The previous chunk ended with an escape character ('\\')
+  cursor_end_array = -1
+
+  # Now we read the file in chunks searching for '[' or ']' with the rule
   # - Found `open_bracket` -> brackets_open + 1
   # - Found `close_bracket` -> brackets_open - 1
-  # Until square_bracket_open = 0
-  while brackets_open != 0:
-    char = file.read(1)
-    if char == open_bracket: brackets_open += 1
-    elif char == close_bracket: brackets_open -= 1
+  # Until brackets_open = 0
+  while cursor_end_array == -1:
+    chunk_start = file.tell()
+    chunk = file.read(STREAM_CHUNK_SIZE)
+    if not chunk: break # End of file, the brackets are not balanced
+
+    # Without strings in the chunk we can count the brackets in bulk,
+    # as long as the closing bracket we are searching is not in this chunk.
+    # It cannot be if there are fewer closing brackets than open ones, otherwise
+    # the brackets could be balanced before an opening bracket of the same chunk
+    if not in_string and not b'"' in chunk and chunk.count(cb) < brackets_open:
+      brackets_open += chunk.count(ob) - chunk.count(cb)
+      continue
+
+    # Otherwise we move from a relevant character to the next one
+    pos = 1 if skip_next else 0
+    skip_next = False
+    while pos < len(chunk):
+      if in_string:
+        match = inside_string.search(chunk, pos)
+        if match is None: break
+        pos = match.end()
+
+        # Skip the escaped character, it may be in the next chunk
+        if match.group() == b'\\':
+          pos += 1
+          skip_next = pos > len(chunk)
+        else: in_string = False
+      else:
+        match = outside_string.search(chunk, pos)
+        if match is None: break
+        pos = match.end()
+
+        if match.group() == b'"': in_string = True
+        elif match.group() == ob: brackets_open += 1
+        else:
+          brackets_open -= 1
 
-  # We have reached the end of the array!
-  cursor_end_array = file.tell()
+          # We have reached the end of the array!
+          if brackets_open == 0:
+            cursor_end_array = chunk_start + pos
+            break
 
-  # Return to the original position
-  if reset:
-    file.seek(start)
+  # Return to the original position or move after the closing bracket
+  file.seek(start if reset or cursor_end_array == -1 else cursor_end_array)
 
   # Return the position of the closing bracket
   return cursor_end_array
 
-def stream_search(path: str, pattern: str, start = 0) -> int:
-  # To be able to move to a file to taste it is necessary to read it through bytes,
-  # since however there are different languages and codes, there is the risk of
-  # reading a character in half. For example, if we read a file with Chinese characters:
+def map_file(path: str) -> mmap.mmap:
+  '''
+  Map a file in memory (read only), so that it can be shared by all the functions
+  that need to read it without opening and scanning it again.
+  '''
+  with open(path, 'rb') as f:
+    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+  # The file is mostly scanned from the start to the end, so where it is supported
+  # (not on Windows) we ask the OS to read ahead the pages that follow the current one
+  if hasattr(mmap, 'MADV_SEQUENTIAL'):
+    mm.madvise(mmap.MADV_SEQUENTIAL)
+
+  return mm
+
+def find_in_mm(mm: mmap.mmap, pattern: bytes, start = 0) -> int:
+  # The file is searched as bytes, so that the pattern is compared in
+  # its UTF-8 representation and we never read a character in half.
+  # For example, if we read a file with Chinese characters:
   #
   # "game 素" = b'game \xe7\xb4\xa0'
   #
-  # If we read 6 bytes we will get b'game \xe7 'in which the last character does not make sense.
-  #
-  # We must then translate what we read and which we compare in the same language,
-  # or in the decimal representation of the bytes in UTF-8:
-  #
-  # 1. From string to bytes: str.encode("game 素") -> b'game \xe7\xb4\xa0'
-  # 2. From bytes to decimal rapresentation: b'game \xe7\xb4\xa0' -> [103, 97, 109, 101, 32, 231, 180, 160]
+  # The search itself is done by `mmap.find` in C, without copying the file in memory.
+  # Return the index of the first occurrence or -1 if not found
+  return mm.find(pattern, start)
+
+def locate_anchors(mm: mmap.mmap) -> dict:
+  '''
+  Find the opening bracket of the "textList" array and of the "gameInformation" node.
 
-  # Convert pattern from string to dec array
-  DEC_ARRAY_PATTERN = [i for i in str.encode(pattern)]
+  The offset of a node not found is -1.
+  '''
+  anchors = {}
+  for key, open_bracket in ((b'"textList"', b'['), (b'"gameInformation"', b'{')):
+    index = find_in_mm(mm, key)
+    anchors[key.strip(b'"').decode()] = find_in_mm(mm, open_bracket, index) if index != -1 else -1
+  return anchors
 
-  # Define constants and variables
-  STREAM_LENGTH = len(DEC_ARRAY_PATTERN)
-  stream: str = None
+def splice_replace(path: str, start: int, old_length: int, new_bytes: bytes):
+  '''
+  Replace `old_length` bytes of a file, starting from `start`, with `new_bytes`.
 
-  # In order to use 'seek' we need to open the file as binary
-  with open(path, 'rb') as f:
-    # Find the end position
-    f.seek(0, 2)
-    end_position = f.tell()
-    
-    # Set the cursor to the starting position
+  The data following the replaced bytes is moved in place, without a temporary file.
+  '''
+  delta = len(new_bytes) - old_length
+  tail_start = start + old_length
+
+  with open(path, "r+b") as f:
+    size = f.seek(0, 2)
+
+    # The new data is longer: move the tail forward starting from the end of the
+    # file, so that no data is overwritten before it has been moved
+    if delta > 0:
+      position = size
+      while position > tail_start:
+        length = min(STREAM_CHUNK_SIZE, position - tail_start)
+        position -= length
+        f.seek(position)
+        chunk = f.read(length)
+        f.seek(position + delta)
+        f.write(chunk)
+
+    # The new data is shorter: move the tail backward starting
+    # from the start of the tail, then ignore excessive data
+    elif delta < 0:
+      position = tail_start
+      while position < size:
+        f.seek(position)
+        chunk = f.read(STREAM_CHUNK_SIZE)
+        f.seek(position + delta)
+        f.write(chunk)
+        position += len(chunk)
+      f.truncate(size + delta)
+
+    # Write the new data
     f.seek(start)
+    f.write(new_bytes)
 
-    # Cycle until we foud a match or the file end
-    while f.tell() < end_position:
-      # Load stream block and convert it to decimal array
-      stream = [i for i in f.read(STREAM_LENGTH)]
+def load_json(json_path: str):
+  with open(json_path, "rb") as f:
+    return json_loads(f.read())
 
-      # Find all occourrences of pattern[0] in stream
-      occourrences = [i for i, char in enumerate(stream) if char == DEC_ARRAY_PATTERN[0]]
-      
-      # Check, for all indices, if after the index there are others common letters (decimal bytes)
-      for i in occourrences:
-        # Extract the subset from the stream
-        subset = stream[i:]
-        
-        # Nope, we didn't find what we were searching
-        if not is_slice_in_list(subset, DEC_ARRAY_PATTERN): continue
-
-        # We have found our string!
-        if subset == DEC_ARRAY_PATTERN: return f.tell() - STREAM_LENGTH
-        # We found a partial match:
-        # Find in the file the position of the current index 'i'
-        # Process again to find (potentially) the searched string
-        else:
-            index = f.tell() - len(subset)
-            f.seek(index)
-            break # Ignore other matches
-    return -1
+def save_json(data, json_path: str):
+  if orjson is not None:
+    with open(json_path, "wb") as f:
+      f.write(orjson.dumps(data))
+  else:
+    # Write the data in chunks while it is serialized, without creating the whole string in memory
+    with open(json_path, "w", encoding="utf-8") as f:
+      json.dump(data, f, ensure_ascii=False, separators=(',',':'))
 
 def optimize(project_json_path: str):
-  with open(project_json_path, "r+", encoding='utf-8') as f:
-    # Deserialize full JSON file
-    data = json.load(f)
-
-    # Return to the start
-    f.seek(0)
+  '''
+  Remove the whitespaces outside the JSON strings.
 
-    # Serialize JSON file without indent and separators
-    json.dump(data, f, indent=None, separators=(',',':'))
+  The file is read in chunks, so it is never loaded entirely in memory,
+  and written into a temporary file that then replaces the original one.
+  '''
+  directory = path.dirname(path.abspath(project_json_path))
+  with open(project_json_path, "rb") as f, tempfile.NamedTemporaryFile(dir=directory, delete=False) as fw:
+    # Part of the previous chunk containing a string not yet terminated
+    pending = b''
 
-    # Ignore excessive data
-    f.truncate()
+    while True:
+      chunk = f.read(STREAM_CHUNK_SIZE)
+      data = pending + chunk
+      pending = b''
+      output = bytearray()
+      position = 0
+
+      # Strip the whitespaces between a string and the next one, copy the strings as they are
+      while position < len(data):
+        quote = data.find(b'"', position)
+        if quote == -1:
+          output += data[position:].translate(None, JSON_WHITESPACES)
+          break
+        output += data[position:quote].translate(None, JSON_WHITESPACES)
+
+        # The string continues in the next chunk
+        match = JSON_STRING_END.match(data, quote + 1)
+        if match is None:
+          pending = data[quote:]
+          break
+        output += data[quote:match.end()]
+        position = match.end()
+
+      fw.write(output)
+
+      # End of file, write what remains as it is
+      if not chunk:
+        fw.write(pending)
+        break
+
+  # Replace the original file keeping its permissions
+  copymode(project_json_path, fw.name)
+  replace(fw.name, project_json_path)
 
 ### Translation related functions ###
-def extract_localization(project_json_path: str, file):
-  # After making us sure that the file exists, we read it as a stream,
-  # so as not to saturate the memory
-  with open(project_json_path, "r", encoding='utf-8') as f:
-    # Find the start of the "textList" array (opening bracket '[')
-    textlist_index = stream_search(project_json_path, 'textList')
-    textlist_index = stream_search(project_json_path, '[', textlist_index)
-
-    # We need to find the end of the "textList" array
-    f.seek(textlist_index)
-    end_texlist_index = find_couple_brackets_end(f)
-    
-    # Extract that node in the passed file
-    with open(file.name, 'w') as fw:
-      data = f.read(end_texlist_index - textlist_index)
-      js = json.loads(data)
-      json.dump(js, fw)
+def extract_localization(mm: mmap.mmap, anchors: dict) -> list:
+  '''
+  Parse the "textList" array found by `locate_anchors`, the same one
+  that is then replaced by `add_translation`.
+  '''
+  # The start of the "textList" array (opening bracket '[')
+  textlist_index = anchors['textList']
+
+  # We need to find the end of the "textList" array
+  mm.seek(textlist_index)
+  end_textlist_index = find_couple_brackets_end(mm)
+  if end_textlist_index == -1:
+    message('error', "The 'textList' node is not terminated, check that the file is not damaged")
+    exit(1)
+
+  # Parse only the bytes of the array, without loading in memory the rest of 'project.json'
+  return json_loads(mm[textlist_index:end_textlist_index])
 
-def translate_block(block, index: int, lang_src: str, lang_dest: str, skip=False):
+def collect_texts(block, lang_src: str, lang_dest: str, skip=False):
+  '''
+  Yield the child nodes of a JSON node (block) that need to be translated,
+  each one together with the text to translate.
+  '''
+  # The nodes to visit are kept in a stack instead of using recursion,
+  # so that deeply nested blocks do not reach the recursion limit
+  stack = deque([block])
+  while stack:
+    node = stack.pop()
+    for child in node["children"]:
+      # It can happen in certain cases that the `text` key is not present but 
+      # a further list of children.
+      # 
+      # In this case, the search of the same is required.
+      #
+      # Usually, either there is the `text` key or the `children` key is present.
+      if not "text" in child:
+        if "children" in child: stack.append(child)
+        continue # Skip this node
+
+      # Obtain the text from the desired locale, if the locale choosen
+      # is not available, select the first locale in the list
+      text_map = child["text"]
+      
+      # Avoid empty nodes
+      if not text_map: continue
+      
+      # Skip if the desired language is already present
+      if skip and lang_dest in text_map: continue
+      
+      yield child, text_map[lang_src] if lang_src in text_map else next(iter(text_map.values()))
+
+def split_batches(texts: list):
+  '''
+  Group the texts in batches whose joined length does not exceed `BATCH_MAX_LENGTH`.
+
+  A text longer than the limit is sent alone.
+  '''
+  batch = []
+  length = 0
+  for text in texts:
+    added = len(text) + len(BATCH_SEPARATOR) if batch else len(text)
+    if batch and length + added > BATCH_MAX_LENGTH:
+      yield batch
+      batch = []
+      added = length = len(text)
+    else: length += added
+    batch.append(text)
+
+  if batch: yield batch
+
+def translate_with_backoff(value: str, src: str, dst: str):
+  '''
+  Translate a single string, retrying with an exponential backoff (plus a random
+  jitter) when the translation service limits the requests or is not reachable.
+  '''
+  for attempt in range(MAX_RETRIES + 1):
+    try:
+      # Without `sleep_seconds` translators waits a random time after every request
+      return ts.google(value, from_language=src, to_language=dst, sleep_seconds=0)
+    except OSError as e:
+      # The HTTP errors of `requests` are OSError too: retry only the requests
+      # without a response or refused with 429 (Too Many Requests) or 5xx
+      status = getattr(getattr(e, 'response', None), 'status_code', None)
+      if attempt == MAX_RETRIES or (status is not None and status != 429 and status < 500): raise
+      sleep(min(30, 2 ** attempt) + random())
+
+def translate_text(value: str, src: str, dst: str):
+  '''
+  Translate a single string, returns `None` if the translation fails.
+  '''
+  try:
+    return translate_with_backoff(value, src, dst)
+  except Exception as e:
+    message("error", f"An exception has occurred:\n {e}")
+    message("error", "The last translation was not carried out")
+    return None
+
+def translate_batch(texts: list, src: str, dst: str) -> list:
+  '''
+  Translate a list of strings with a single request, joining them with `BATCH_SEPARATOR`.
+  
+  If the translation engine does not preserve the separators, the strings are
+  translated one by one. The strings not translated are returned as `None`.
+  '''
+  if len(texts) == 1: return [translate_text(texts[0], src, dst)]
+
+  # The request failed (after the retries), repeating it for each string would fail too
+  translation = translate_text(BATCH_SEPARATOR.join(texts), src, dst)
+  if translation is None: return [None] * len(texts)
+
+  parts = BATCH_SEPARATOR_PATTERN.split(translation.strip())
+  if len(parts) == len(texts): return parts
+
+  return [translate_text(text, src, dst) for text in texts]
+
+def translation_codes(lang_src: str, lang_dest: str):
+  # The translation engine needs the ISO 639-1 code (two letters)
+  # or "auto" for automatic language detection
+  src = "auto" if lang_src == "auto" else iso_from_locale(lang_src)
+  return src, iso_from_locale(lang_dest)
+
+def translate_block(block, index: int, lang_src: str, lang_dest: str, skip=False, codes=None):
   '''
   Translate a JSON node (block).
   
+  The strings of the block are deduplicated and translated in batches.
+  `codes` are the languages used by the translation engine (see `translation_codes`),
+  if not specified they are obtained from `lang_src` and `lang_dest`.
   Since `block` is passed by reference, it is not necessary to return any results.
   '''
-  # Find all the child nodes of the block
-  for child in (pbar:=tqdm(block["children"])):
-    pbar.set_description(f"Block {index}")
-    
-    # It can happen in certain cases that the `text` key is not present but 
-    # a further list of children.
-    # 
-    # In this case, the recursive translation of the same is required.
-    #
-    # Usually, either there is the `text` key or the `children` key is present.
-    if not "text" in child:
-      if "children" in child: translate_block(child, 1, lang_src, lang_dest, skip)
-      continue # Skip this node
-
-    # Obtain the text from the desired locale, if the locale choosen
-    # is not available, select the first locale in the list
-    dictionary = dict(child["text"].items())
-    
-    # Avoid empty nodes
-    if len(dictionary) == 0: continue
-    
-    # Skip if the desired language is already present
-    if skip and lang_dest in dictionary: continue
-    
-    default_value = list(dictionary.values())[0]
-    value = dictionary.get(lang_src, default_value)
-    
-    # The translation engine needs the ISO 639-1 code (two letters)
-    # or "auto" for automatic language detection
-    src = "auto" if lang_src == "auto" else iso_from_locale(lang_src)
-    
-    # Translate and add the new value to the dict
-    # { 'en_US': 'Hello' } -> { 'en_US': 'Hello', 'it_IT': 'Ciao' }
-    # Note: if lang_src == lang_dest, the value is overwritten.
-    # This is useful when the value stored is not in the correct language
-    # { 'en_US': 'Ciao' } -> { 'en_US': 'Hello' }
-    try:
-      translation = ts.google(value,
-                              from_language=src,
-                              to_language=iso_from_locale(lang_dest),
-                              sleep_seconds=2)
+  src, dst = codes if codes is not None else translation_codes(lang_src, lang_dest)
+
+  # Find all the child nodes of the block to translate
+  nodes = list(collect_texts(block, lang_src, lang_dest, skip))
+
+  # The same text is translated only once, empty texts are not translated at all
+  # and the texts already translated in the past are taken from the cache
+  translations = {value: _TRANSLATION_CACHE.get((src, dst, value)) for _, value in nodes}
+  if "" in translations: translations[""] = ""
+  texts = [value for value, translation in translations.items() if translation is None]
+
+  for batch in tqdm(list(split_batches(texts)), desc=f"Block {index}", mininterval=0.2, miniters=1):
+    for value, translation in zip(batch, translate_batch(batch, src, dst)):
+      translations[value] = translation
+      if translation is not None: _TRANSLATION_CACHE[(src, dst, value)] = translation
+
+  # Add the new value to the dict
+  # { 'en_US': 'Hello' } -> { 'en_US': 'Hello', 'it_IT': 'Ciao' }
+  # Note: if lang_src == lang_dest, the value is overwritten.
+  # This is useful when the value stored is not in the correct language
+  # { 'en_US': 'Ciao' } -> { 'en_US': 'Hello' }
+  with _TRANSLATION_LOCK:
+    for child, value in nodes:
+      if translations[value] is None: continue # The translation was not carried out
       
       # Update translation in the stream
-      child["text"][lang_dest] = translation
-    except Exception as e:
-      message("error", f"An exception has occurred:\n {e}")
-      message("error", "The last translation was not carried out")
-
-def translate_strings(file, lang_src: str, lang_dest: str, skip: bool):
-  with open(file.name, "r+", encoding='utf-8') as f:
-    # Load ALL the file into memory
-    data = json.load(f)
-      
-    # These are "blocks" of string, usually the first 22 blocks
-    # are strings regarding menus, save/load, etc.
-    for i, block in contrib.tenumerate(data):
-      if not "children" in block: continue # Skip node if no children are in the node
-      translate_block(block, i + 1, lang_src, lang_dest, skip)
-        
-      # Return the cursor to the start of the file
-      f.seek(0)
-        
-      # Save block after translation
-      f.write(json.dumps(data))
-
-def add_language_support(project_json_path: str, lang_dest: str):
-  with open(project_json_path, "r+", encoding='utf-8') as f:
-    # Find the node containing the language data (opening bracket '{')
-    gi_index = stream_search(project_json_path, 'gameInformation')
-    gi_index = stream_search(project_json_path, '{', gi_index)
-    
-    # Then we need the closing bracket
-    f.seek(gi_index)
-    end_gi_index = find_couple_brackets_end(f, open_bracket='{', close_bracket='}')
-    
-    # Return to `gi_index` and read `end_gi_index - gi_index` characters
-    data = f.read(end_gi_index - gi_index)
-    js = json.loads(data)
+      child["text"][lang_dest] = translations[value]
 
-    if not lang_dest in js['language']:
-      # Add the support for the translation language
-      js['language'].append(lang_dest)
-    
-      # We need to replace the array but we risk to overwrite other data so we can
-      # save the remaining json file, overwrite the data in 'project.json', then
-      # append the previously saved data
-      temp = tempfile.TemporaryFile(mode='r+', encoding='utf-8')
-      temp.write(f.read()) # Read and write the remaining file
-      temp.seek(0)
-
-      # Memorize the new language
-      f.seek(gi_index)
-      f.write(json.dumps(js))
-      
-      # Now append the previously saved data
-      while True:
-        # Get next line from file
-        line = temp.readline(2048)
-    
-        # if line is empty
-        # end of file is reached
-        if not line: break
-        
-        # Transfer line
-        f.write(line)
-
-def add_translation(project_json_path: str, file):
-  with open(project_json_path, "r+", encoding='utf-8') as f:
-    # Find the start of the "textList" array (opening bracket '[')
-    textlist_index = stream_search(project_json_path, 'textList')
-    textlist_index = stream_search(project_json_path, '[', textlist_index)
-
-    # We need to find the end of the "textList" array
-    # Mantain the position of the array end (reset=False)
-    f.seek(textlist_index)
-    find_couple_brackets_end(f, reset=False)
-
-    # We need to replace the array with the translation array but we risk to overwrite other data
-    # we can save the remaining json file, overwrite the data in 'project.json', append the 
-    # previously saved data
-    temp = tempfile.TemporaryFile(mode='r+', encoding='utf-8')
-    temp.write(f.read()) # Read and write the remaining file
-    temp.seek(0)
-
-    # Load the translations
-    with open(file.name, 'r', encoding='utf-8') as fo:
-      translation_array = json.load(fo)
-
-      # Return to the start of the "textList" array
-      f.seek(textlist_index)
-
-      # Write the translated strings
-      f.write(json.dumps(translation_array))
-
-    # Now append the previously saved data line by line
-    while True:
-      # Get next line from file
-      line = temp.readline(2048)
+def translate_strings(data: list, lang_src: str, lang_dest: str, skip: bool, concurrency=8, checkpoint_path=None):
+  '''
+  Translate the blocks of the "textList" array.
+
+  Since `data` is passed by reference, it is not necessary to return any results.
+  '''
+  # The languages used by the translation engine are the same for all the blocks
+  codes = translation_codes(lang_src, lang_dest)
+
+  def translate(item):
+    i, block = item
+    if not "children" in block: return # Skip node if no children are in the node
+    translate_block(block, i + 1, lang_src, lang_dest, skip, codes)
+
+  # These are "blocks" of string, usually the first 22 blocks
+  # are strings regarding menus, save/load, etc.
+  #
+  # The requests are I/O-bound, so the blocks are translated in parallel
+  # by at most `concurrency` threads
+  with ThreadPoolExecutor(max_workers=concurrency) as executor:
+    results = executor.map(translate, enumerate(data))
+    for i, _ in enumerate(tqdm(results, total=len(data))):
+      # Save the progress in `checkpoint_path` every `CHECKPOINT_INTERVAL` blocks, so that the
+      # translated strings can be imported again ('-i' argument) if the execution is interrupted
+      if checkpoint_path is not None and (i + 1) % CHECKPOINT_INTERVAL == 0:
+        # Write a temporary file and then replace the checkpoint,
+        # so that an interrupted save does not corrupt it
+        with _TRANSLATION_LOCK: save_json(data, f"{checkpoint_path}.tmp")
+        replace(f"{checkpoint_path}.tmp", checkpoint_path)
+
+        # Now the file contains data that can be imported
+        if i + 1 == CHECKPOINT_INTERVAL:
+          message('info', f"The progress of the translation is saved in {checkpoint_path}")
+
+def add_language_support(project_json_path: str, mm: mmap.mmap, anchors: dict, lang_dest: str):
+  '''
+  Add `lang_dest` to the languages supported by the game.
+
+  `mm` is the memory map of `project_json_path` and `anchors` the offsets found in it
+  (see `locate_anchors`). The map is closed before the file is modified, so it must
+  be mapped again to be read after this function.
+  '''
+  # The node containing the language data (opening bracket '{')
+  gi_index = anchors['gameInformation']
   
-      # if line is empty
-      # end of file is reached
-      if not line: break
-      
-      # Transfer line
-      f.write(line)
+  # The node is small, so we parse it from a window of the file: the decoder stops
+  # at the end of the node and returns its position, so we do not need to search
+  # the closing bracket. The window is doubled if the node is bigger than it
+  decoder = json.JSONDecoder()
+  window_size = NODE_WINDOW_SIZE
+  while True:
+    # The incremental decoder ignores a character cut in half at the end of the window
+    window = getincrementaldecoder('utf-8')().decode(mm[gi_index:gi_index + window_size])
+    try:
+      js, end = decoder.raw_decode(window)
+      break
+    except json.JSONDecodeError:
+      if gi_index + window_size >= len(mm): raise
+      window_size *= 2
+  mm.close()
+
+  # Convert the position of the end of the node from characters to bytes
+  end_gi_index = gi_index + len(window[:end].encode('utf-8'))
+
+  if not lang_dest in js['language']:
+    # Add the support for the translation language
+    js['language'].append(lang_dest)
+
+    # Memorize the new language, the remaining file is moved in place
+    splice_replace(project_json_path, gi_index, end_gi_index - gi_index, json_dumps(js))
+
+def add_translation(project_json_path: str, mm: mmap.mmap, anchors: dict, translation_array: list):
+  '''
+  Replace the "textList" array of `project_json_path` with the translated strings.
+
+  `mm` is the memory map of `project_json_path` and `anchors` the offsets found in it
+  (see `locate_anchors`). The map is closed before the file is modified, so it must
+  be mapped again to be read after this function.
+  '''
+  # The start of the "textList" array (opening bracket '[')
+  textlist_index = anchors['textList']
+
+  # We need to find the end of the "textList" array
+  mm.seek(textlist_index)
+  end_textlist_index = find_couple_brackets_end(mm)
+  mm.close()
+  if end_textlist_index == -1:
+    message('error', "The 'textList' node is not terminated, check that the file is not damaged")
+    exit(1)
+
+  # Replace the array with the translated strings, the remaining file is moved in place
+  splice_replace(project_json_path, textlist_index, end_textlist_index - textlist_index,
+                 json_dumps(translation_array))
 
 if __name__ == "__main__":
   parser = argparse.ArgumentParser(description='''Application for the localization of games developed with Pixel Game Maker MV.\n\n
@@ -334,15 +588,22 @@ if __name__ == "__main__":
   parser.add_argument('-s', '--skip', action="store_true",
                       help="Specifies whether to skip the translation in the event that the specified language is already present (useful in case of partial localization)")
   
+  parser.add_argument('-c', '--concurrency', action="store", type=int, default=8,
+                      help="Maximum number of blocks translated in parallel")
+  
   parser.add_argument('-e', '--export-localization', action="store", default=None,
                       help="Path to which export localization strings, in the event that it is necessary to process them later and so as not to have to analyze 'project.json' again")
   
   parser.add_argument('-i', '--import-localization', action="store", default=None, help="Path from which import the localization strings exported previously")
   
   parser.add_argument('-o', '--optimize', action="store_true", default=None,
-                      help="Optimize the JSON file to reduce its size and processing time. Requires at least 1 GB of free RAM")
+                      help="Optimize the JSON file to reduce its size and processing time")
   
   args = vars(parser.parse_args())
+
+  # At least one thread is needed to translate the strings
+  if args["concurrency"] < 1:
+    parser.error("argument -c/--concurrency: must be at least 1")
   
   # Extract the path, else if no argument is specified, check
   # if the 'project.json' file is in the current directory
@@ -363,37 +624,55 @@ if __name__ == "__main__":
     optimize(project_json_path)
     message('info', 'Optimization done')
 
-  # Create a temporary file where store the localization strings
-  localization_file = tempfile.TemporaryFile(delete=False)
-  # To avoid reading/writing a ENORMOUS json file, we extract the interested strings in a temporary file
+  # Map 'project.json' in memory, all the functions that read it share the same map,
+  # and find the position of the nodes we need
+  project_map = map_file(project_json_path)
+  anchors = locate_anchors(project_map)
+  if -1 in anchors.values():
+    message('error', "The file does not contain the 'textList' or 'gameInformation' node, check that it is decrypted")
+    exit(1)
+
+  # To avoid reading/writing a ENORMOUS json file, we extract only the interested strings
   if args['import_localization'] is None:
     message('info', "Extracting localization strings, it may requires some time, please wait")
-    extract_localization(project_json_path, localization_file)
+    localization = extract_localization(project_map, anchors)
     
     # If the user specified the '-e' option, save the data in the selected path
     if not args['export_localization'] is None and not path.exists(args['export_localization']):
-      copy(localization_file.name, args['export_localization'])
+      save_json(localization, args['export_localization'])
       message('info', f"Strings extracted to {args['export_localization']}")
 
   # The import path does not exists
   elif not path.exists(args['import_localization']):
     message('error', "The import ('-i' argument) path does not exists, check that the path is exact")
     exit(1)
-  # Read the data and save it in the temporary file
+  # Read the data
   else:
     message('info', f"Importing strings from {args['import_localization']}")
-    copy(args["import_localization"], localization_file.name)
+    localization = load_json(args['import_localization'])
 
-  message('info', f"Strings extracted to {localization_file.name}")
+  # Path of the temporary file where the progress of the translation is saved,
+  # it is created only when the first checkpoint is reached
+  checkpoint_path = path.join(tempfile.gettempdir(), f"pgm-translator-{getpid()}.json")
 
-  # Now we can re-open the file and translate the strings inside
+  # Now we can translate the strings, the translations carried out
+  # are saved in the cache even if the execution is interrupted
+  load_translation_cache()
+  atexit.register(save_translation_cache)
   message('info', "Translating strings, it may require some time, please wait")
-  translate_strings(localization_file, args["from_lang"], args["to_lang"], args["skip"])
+  translate_strings(localization, args["from_lang"], args["to_lang"], args["skip"], args["concurrency"], checkpoint_path)
   message('info', "All strings translated")
 
   # If we not add the support for the language, we cannot use the localization in-game
   # so we add it and then we write the translated strings into the 'project.json' file
   message('info', "Saving 'project.json', it may require some time, please wait")
-  add_language_support(project_json_path, args["to_lang"])
-  add_translation(project_json_path, localization_file)
+  # The map is closed when the file is modified, so we need to map it again
+  # and find the nodes again, since they may have been moved
+  add_language_support(project_json_path, project_map, anchors, args["to_lang"])
+  project_map = map_file(project_json_path)
+  anchors = locate_anchors(project_map)
+  add_translation(project_json_path, project_map, anchors, localization)
+
+  # The translated strings are saved in 'project.json', the progress is no longer needed
+  if path.exists(checkpoint_path): remove(checkpoint_path)
   message('info', "Operation completed, you can now close this window")
\ No newline at end of file